@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import FuelStation, Route
+from .models import FuelStation, Route, StatePriceAggregate, GridCellPriceAggregate
 
 admin.site.register(FuelStation)
 admin.site.register(Route)
+admin.site.register(StatePriceAggregate)
+admin.site.register(GridCellPriceAggregate)
@@ -0,0 +1,125 @@
+from decimal import Decimal
+from statistics import median
+
+from django.db import transaction
+
+from .data_version import bump_station_data_version
+from .models import FuelStation, StatePriceAggregate, GridCellPriceAggregate, GridCellState, as_price
+from .spatial import GRID_CELL_DEGREES, grid_cell
+
+# Used when no aggregates have been computed yet (e.g. an empty database)
+DEFAULT_FUEL_PRICE = 3.50
+
+# SQLite limits the number of query parameters, so stale cells are deleted in batches
+DELETE_BATCH_SIZE = 500
+
+
+def price_stats(prices):
+    """
+    Summarizes a list of prices.
+    Returns a dict with station_count, min_price, p10_price (nearest-rank) and median_price.
+    """
+    prices = sorted(Decimal(price) for price in prices)
+    p10_rank = max(0, -(-len(prices) * 10 // 100) - 1)  # ceil(n * 0.10) - 1
+    return {
+        "station_count": len(prices),
+        "min_price": prices[0],
+        "p10_price": prices[p10_rank],
+        "median_price": as_price(median(prices)),
+    }
+
+
+def _cell_bounds(cells):
+    """
+    Returns the (row_min, row_max, col_min, col_max) bounding box of the given grid cells.
+    Stations and aggregates are selected with one range query over it and filtered to the
+    exact cells in Python: one OR term per cell would exceed SQLite's expression depth
+    limit (1000) on large imports.
+    """
+    rows = [row for row, _ in cells]
+    cols = [col for _, col in cells]
+    return min(rows), max(rows), min(cols), max(cols)
+
+
+@transaction.atomic
+def refresh_price_aggregates(states=None, cells=None):
+    """
+    Recomputes the state and grid cell price aggregates.
+    - `states` / `cells`: only recompute these keys (incremental refresh after an import).
+    - None recomputes everything for that level; an empty collection skips it.
+    Aggregates whose stations have all disappeared are deleted.
+    """
+    # **1️⃣ State aggregates**
+    if states is None or states:
+        stations = FuelStation.objects.all()
+        if states is not None:
+            stations = stations.filter(state__in=states)
+
+        prices_by_state = {}
+        for state, price in stations.values_list("state", "price").iterator():
+            prices_by_state.setdefault(state, []).append(price)
+
+        for state, prices in prices_by_state.items():
+            StatePriceAggregate.objects.update_or_create(state=state, defaults=price_stats(prices))
+
+        stale = StatePriceAggregate.objects.exclude(state__in=prices_by_state)
+        if states is not None:
+            stale = stale.filter(state__in=states)
+        stale.delete()
+
+    # **2️⃣ Grid cell aggregates (geocoded stations only)**
+    if cells is None or cells:
+        stations = FuelStation.objects.filter(lat__isnull=False, lon__isnull=False)
+        aggregates = GridCellPriceAggregate.objects.all()
+        if cells is not None:
+            cells = set(cells)
+            row_min, row_max, col_min, col_max = _cell_bounds(cells)
+            stations = stations.filter(
+                lat__gte=row_min * GRID_CELL_DEGREES, lat__lt=(row_max + 1) * GRID_CELL_DEGREES,
+                lon__gte=col_min * GRID_CELL_DEGREES, lon__lt=(col_max + 1) * GRID_CELL_DEGREES,
+            )
+            aggregates = aggregates.filter(row__gte=row_min, row__lte=row_max, col__gte=col_min, col__lte=col_max)
+
+        prices_by_cell = {}
+        states_by_cell = {}
+        for lat, lon, price, state in stations.values_list("lat", "lon", "price", "state").iterator():
+            cell = grid_cell(lat, lon)
+            if cells is not None and cell not in cells:
+                continue
+            prices_by_cell.setdefault(cell, []).append(price)
+            states_by_cell.setdefault(cell, set()).add(state)
+
+        for (row, col), prices in prices_by_cell.items():
+            aggregate, _ = GridCellPriceAggregate.objects.update_or_create(
+                row=row, col=col, defaults=price_stats(prices)
+            )
+            # **Keep the state → cell index in sync for the dashboard filter**
+            aggregate.states.exclude(state__in=states_by_cell[(row, col)]).delete()
+            GridCellState.objects.bulk_create(
+                [GridCellState(cell=aggregate, state=state) for state in states_by_cell[(row, col)]],
+                ignore_conflicts=True,
+            )
+
+        stale_ids = [
+            pk for pk, row, col in aggregates.values_list("id", "row", "col")
+            if (row, col) not in prices_by_cell and (cells is None or (row, col) in cells)
+        ]
+        for start in range(0, len(stale_ids), DELETE_BATCH_SIZE):
+            GridCellPriceAggregate.objects.filter(id__in=stale_ids[start:start + DELETE_BATCH_SIZE]).delete()
+
+    bump_station_data_version()
+
+
+def get_fallback_fuel_price():
+    """
+    Returns the national median price estimated from the state aggregates
+    (state medians weighted by station count), or DEFAULT_FUEL_PRICE if there are none.
+    """
+    total_count = 0
+    weighted_sum = 0.0
+    for count, median_price in StatePriceAggregate.objects.values_list("station_count", "median_price"):
+        total_count += count
+        weighted_sum += count * float(median_price)
+    if not total_count:
+        return DEFAULT_FUEL_PRICE
+    return weighted_sum / total_count
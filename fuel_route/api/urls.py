@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import calculate_route
+from .views import calculate_route, price_aggregates, reachable_stations
 
 urlpatterns = [
     path("calculate-route/", calculate_route, name="calculate_route"),
+    path("price-aggregates/", price_aggregates, name="price_aggregates"),
+    path("reachable-stations/", reachable_stations, name="reachable_stations"),
 ]
@@ -1,16 +1,53 @@
 from django.http import JsonResponse
-from fuel_route.models import FuelStation
+from fuel_route.models import FuelStation, StatePriceAggregate, GridCellPriceAggregate
+from fuel_route.aggregates import get_fallback_fuel_price
+from fuel_route.response_cache import cached_response
+from fuel_route.road_graph import road_graph_key
+from fuel_route.routing import get_routing_backend, RoutingError
+from fuel_route.snapshot import get_station_snapshot, get_station_index
+from fuel_route.spatial import GRID_CELL_DEGREES, haversine, grid_cell
+from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
-import os
-import requests
+import heapq
+import math
 import polyline
-from math import radians, sin, cos, sqrt, atan2
 import json
 
-# Retrieve API key for OpenRouteService (ORS) from environment variables
-ORS_API_KEY = os.getenv('ORS_API_KEY')
+# Miles per gallon assumed for fuel calculations
+DEFAULT_MPG = 10
+
+# Typical ratio of road distance to straight-line distance, used to approximate road reach
+ROAD_CIRCUITY = 1.2
+
+# Stations must be within this distance (miles) of a sampled route point
+ROUTE_CORRIDOR_MILES = 5
+
+# The optimizer samples every 10th route point (about every 10 miles)
+ROUTE_SAMPLE_STEP = 10
+
+
+def route_cache_key(request):
+    """
+    Normalized coordinates of a calculate-route request, or None if the body is invalid.
+    With the local backend the road graph file version is part of the key, so replacing
+    the graph invalidates the cached routes.
+    """
+    try:
+        data = json.loads(request.body)
+        coordinates = [round(float(data[key]), 6) for key in ("start_lat", "start_lon", "end_lat", "end_lon")]
+    except (ValueError, TypeError, KeyError):
+        return None
+    params = {"coordinates": coordinates, "routing_backend": settings.ROUTING_BACKEND}
+    if settings.ROUTING_BACKEND == "local":
+        try:
+            params["road_graph"] = road_graph_key(settings.ROAD_GRAPH_PATH)
+        except OSError:
+            return None  # No graph file: the backend returns an error, nothing to cache
+    return params
+
 
 @csrf_exempt
+@cached_response(route_cache_key)
 def calculate_route(request):
     """
     API endpoint that calculates an optimal fuel-up route between a start and end location in the USA.
@@ -20,7 +57,7 @@ def calculate_route(request):
       - The lowest fuel price at each required stop
     
     Returns:
-      - The full route from OpenRouteService (ORS)
+      - The full route from the routing backend (OpenRouteService by default)
       - The list of optimal fuel stations along the route
       - The total fuel cost for the trip
     """
@@ -36,39 +73,195 @@ def calculate_route(request):
     if not all([start_lat, start_lon, end_lat, end_lon]):
         return JsonResponse({"error": "Invalid input: Missing coordinates"}, status=400)
     
-    # Call OpenRouteService API to retrieve route details
-    ors_url = "https://api.openrouteservice.org/v2/directions/driving-car"
-    payload = {"coordinates": [[start_lon, start_lat], [end_lon, end_lat]]}
-    headers = {"Authorization": ORS_API_KEY}
-    response = requests.post(ors_url, json=payload, headers=headers)
+    # Retrieve route details from the configured routing backend (OpenRouteService or the local road graph)
+    try:
+        route_data = get_routing_backend().route(start_lat, start_lon, end_lat, end_lon)
+    except RoutingError as e:
+        return JsonResponse({"error": str(e)}, status=500)
     
-    if response.status_code == 200:
-        route_data = response.json()
-        
-        # Convert total route distance from meters to miles
-        total_distance_meters = route_data['routes'][0]['segments'][0]['distance']
-        total_distance_miles = total_distance_meters / 1609.34  # 1 mile = 1609.34 meters
-        max_range = 500  # Maximum vehicle range in miles
-        
-        # If the total route distance is within one tank (500 miles), no fuel stops needed
-        if total_distance_miles <= max_range:
-            total_cost = calculate_fuel_cost(route_data, 3.50)  # Assuming $3.50 per gallon
-            return format_geojson_response(route_data, [], total_cost)
-        
-        # Fetch available fuel stations from the database
+    # Convert total route distance from meters to miles
+    total_distance_meters = route_data['routes'][0]['segments'][0]['distance']
+    total_distance_miles = total_distance_meters / 1609.34  # 1 mile = 1609.34 meters
+    max_range = 500  # Maximum vehicle range in miles
+    fuel_price = get_fallback_fuel_price()  # National median from the state price aggregates
+    
+    # If the total route distance is within one tank (500 miles), no fuel stops needed
+    if total_distance_miles <= max_range:
+        total_cost = calculate_fuel_cost(route_data, fuel_price)
+        return format_geojson_response(route_data, [], total_cost)
+    
+    # Fetch fuel stations along the route from the memory-mapped snapshot, or all of them from the database
+    snapshot = get_station_snapshot()
+    if snapshot is not None:
+        if not len(snapshot):
+            return JsonResponse({"error": "No fuel stations available"}, status=500)
+        fuel_stations = stations_near_route(snapshot, route_data)
+    else:
         fuel_stations = list(FuelStation.objects.all().values())
         if not fuel_stations:
             return JsonResponse({"error": "No fuel stations available"}, status=500)
-        
-        # Compute the optimal fuel stations along the route
-        optimal_stations = get_optimal_fuel_stations(route_data, fuel_stations, max_range)
-        
-        # Compute the total fuel cost
-        total_cost = calculate_fuel_cost(route_data, 3.50) 
-        
-        return format_geojson_response(route_data, optimal_stations, total_cost)
-    else:
-        return JsonResponse({"error": "Error fetching route data from ORS"}, status=500)
+    
+    # Compute the optimal fuel stations along the route
+    optimal_stations = get_optimal_fuel_stations(route_data, fuel_stations, max_range)
+    if snapshot is not None:
+        optimal_stations = hydrate_stations(optimal_stations)
+    
+    # Compute the total fuel cost
+    total_cost = calculate_fuel_cost(route_data, fuel_price)
+    
+    return format_geojson_response(route_data, optimal_stations, total_cost)
+
+
+def price_aggregates_cache_key(request):
+    """Only `state` changes the response; it is upper-cased so ?state=tx and ?state=TX share an entry."""
+    return {"state": request.GET.get("state", "").upper()}
+
+
+@cached_response(price_aggregates_cache_key)
+def price_aggregates(request):
+    """
+    API endpoint that serves the precomputed price aggregates for dashboards.
+    Optional query parameter `state` limits the response to one state.
+
+    Returns:
+      - states: min / p10 / median price and station count per state
+      - cells: the same summary per spatial grid cell (with the cell's south-west corner)
+    """
+    fields = ("station_count", "min_price", "p10_price", "median_price", "updated_at")
+    states = StatePriceAggregate.objects.order_by("state")
+    cells = GridCellPriceAggregate.objects.order_by("row", "col")
+    state = request.GET.get("state", "").upper()
+    if state:
+        states = states.filter(state=state)
+        # Only cells containing at least one station of that state
+        cells = cells.filter(states__state=state)
+
+    cells = cells.values("row", "col", *fields)
+
+    return JsonResponse({
+        "states": list(states.values("state", *fields)),
+        "cells": [
+            {**cell, "lat": cell["row"] * GRID_CELL_DEGREES, "lon": cell["col"] * GRID_CELL_DEGREES}
+            for cell in cells
+        ],
+    })
+
+
+def reachable_stations(request):
+    """
+    API endpoint that answers "which stations can this truck reach, and which is cheapest?"
+    straight from the spatial station index (no routing call).
+
+    Query parameters:
+      - lat, lon: current position (required)
+      - gallons: fuel left in the tank (required)
+      - mpg: fuel efficiency (default: 10)
+      - mode: "radius" (straight-line reach) or "road" (reach divided by ROAD_CIRCUITY, default)
+      - k: only keep the k nearest reachable stations
+      - max_price: only keep stations at or below this price
+      - limit: maximum number of stations returned (default: 20)
+
+    Returns:
+      - reach_miles: the search radius used
+      - cheapest: the cheapest reachable station (or null)
+      - stations: reachable stations ranked by price, then distance
+    """
+    try:
+        lat = float(request.GET["lat"])
+        lon = float(request.GET["lon"])
+        gallons = float(request.GET["gallons"])
+        mpg = float(request.GET.get("mpg", DEFAULT_MPG))
+        k = int(request.GET["k"]) if "k" in request.GET else None
+        max_price = float(request.GET["max_price"]) if "max_price" in request.GET else None
+        limit = int(request.GET.get("limit", 20))
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "Invalid input: lat, lon and gallons are required numbers"}, status=400)
+
+    numbers = (lat, lon, gallons, mpg) + ((max_price,) if max_price is not None else ())
+    if not all(math.isfinite(value) for value in numbers):
+        return JsonResponse({"error": "Invalid input: numbers must be finite"}, status=400)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return JsonResponse({"error": "Invalid input: lat must be in [-90, 90] and lon in [-180, 180]"}, status=400)
+
+    mode = request.GET.get("mode", "road")
+    if mode not in ("radius", "road"):
+        return JsonResponse({"error": "Invalid input: mode must be 'radius' or 'road'"}, status=400)
+    if gallons < 0 or mpg <= 0:
+        return JsonResponse({"error": "Invalid input: gallons must be >= 0 and mpg > 0"}, status=400)
+    if (k is not None and k < 0) or limit < 0:
+        return JsonResponse({"error": "Invalid input: k and limit must be >= 0"}, status=400)
+
+    # **1️⃣ How far can the truck go?**
+    reach_miles = gallons * mpg
+    if mode == "road":
+        reach_miles /= ROAD_CIRCUITY  # Roads are longer than the straight line
+    if not math.isfinite(reach_miles):
+        return JsonResponse({"error": "Invalid input: gallons * mpg is too large"}, status=400)
+
+    # **2️⃣ Collect reachable stations from the spatial grid**
+    index = get_station_index()
+    prices = index.prices
+    candidates = [
+        (i, distance) for i, distance in index.indices_near(lat, lon, reach_miles)
+        if max_price is None or prices[i] <= max_price
+    ]
+    if k is not None:
+        candidates = heapq.nsmallest(k, candidates, key=lambda c: c[1])
+
+    # **3️⃣ Rank by price, then distance**
+    def rank(candidate):
+        return prices[candidate[0]], candidate[1]
+
+    ranked = heapq.nsmallest(limit, candidates, key=rank)
+    stations = hydrate_stations([
+        {**index.station(i), "distance_miles": round(distance, 2)} for i, distance in ranked
+    ])
+
+    # The cheapest station heads the ranking; with limit=0 it's looked up from all candidates
+    cheapest = stations[0] if stations else None
+    if limit == 0 and candidates:
+        i, distance = min(candidates, key=rank)
+        cheapest = next(iter(hydrate_stations([{**index.station(i), "distance_miles": round(distance, 2)}])), None)
+
+    return JsonResponse({
+        "reach_miles": round(reach_miles, 2),
+        "reachable_count": len(candidates),
+        "cheapest": cheapest,
+        "stations": stations,
+    })
+
+
+def stations_near_route(snapshot, route_data):
+    """
+    Uses the snapshot's spatial grid to collect only the stations the optimizer can pick:
+    those within ROUTE_CORRIDOR_MILES of a sampled route point.
+    """
+    decoded_route = polyline.decode(route_data['routes'][0]['geometry'])
+    indices = set()
+    for lat, lon in decoded_route[::ROUTE_SAMPLE_STEP]:
+        indices.update(i for i, _ in snapshot.indices_near(lat, lon, ROUTE_CORRIDOR_MILES))
+    return [snapshot.station(i) for i in sorted(indices)]
+
+
+def hydrate_stations(stations):
+    """
+    Snapshot stations only carry id/lat/lon/price.
+    Loads the remaining details (name, address, ...) for the selected stops from the database.
+    """
+    details = FuelStation.objects.in_bulk([station["id"] for station in stations])
+    hydrated = []
+    for station in stations:
+        fuel_station = details.get(station["id"])
+        if fuel_station is not None:
+            station = {
+                **station,
+                "name": fuel_station.name,
+                "address": fuel_station.address,
+                "city": fuel_station.city,
+                "state": fuel_station.state,
+            }
+        hydrated.append(station)
+    return hydrated
 
 
 def format_geojson_response(route_data, optimal_stations, total_cost):
@@ -162,62 +355,76 @@ def get_optimal_fuel_stations(route_data, fuel_stations, max_range=500, min_rang
     # **3️⃣ Extract the starting point**
     start_lat, start_lon = decoded_route[0]
 
+    # **4️⃣ Filter the fuel stations once (the result doesn't change between segments)**
+    seen_stations = {}  # Keeps track of the cheapest station per location
+    for station in fuel_stations:
+        station_lat = station.get('lat')
+        station_lon = station.get('lon')
+        station_price = float(station.get('price', 0))
+
+        # 🚨 **Conditions:**
+        # - Skip stations with missing latitude/longitude
+        # - Ignore stations too close to the starting point (<50 miles)
+        if station_lat is None or station_lon is None or station_price is None:
+            continue
+
+        if haversine(start_lat, start_lon, station_lat, station_lon) < 50:
+            continue
+
+        station_key = (station_lat, station_lon)
+        if station_key in seen_stations:
+            # **Keep the cheapest station for each location**
+            if station_price < seen_stations[station_key]['price']:
+                seen_stations[station_key] = station
+        else:
+            seen_stations[station_key] = station
+
+    # **5️⃣ Group stations by grid cell, cheapest cells first**
+    # A cell whose minimum price can't beat the current best is skipped entirely.
+    stations_by_cell = {}
+    for station in seen_stations.values():
+        stations_by_cell.setdefault(grid_cell(station['lat'], station['lon']), []).append(station)
+    cell_floors = {
+        cell: min(float(station['price']) for station in stations)
+        for cell, stations in stations_by_cell.items()
+    }
+    ordered_cells = sorted(stations_by_cell, key=cell_floors.get)
+
     while current_mileage < total_distance_miles:
-        # **4️⃣ Define the next stop range for refueling**
+        # **6️⃣ Define the next stop range for refueling**
         next_stop_mileage = min(current_mileage + max_range, total_distance_miles)
-        candidate_stations = []  # Stores fuel stations within the current range
-        seen_stations = {}  # Keeps track of the cheapest station per location
+        route_points = [decoded_route[i] for i in range(int(current_mileage), int(next_stop_mileage), ROUTE_SAMPLE_STEP)  # Scan every 10 miles along the route
+                        if i < len(decoded_route)]
 
         print(f"\n🚗 Checking fuel stations between {current_mileage}-{next_stop_mileage} miles")
 
-        # **5️⃣ Iterate through all fuel stations**
-        for station in fuel_stations:
-            station_lat = station.get('lat')
-            station_lon = station.get('lon')
-            station_price = float(station.get('price', 0))
-
-            # 🚨 **Conditions:**
-            # - Skip stations with missing latitude/longitude
-            # - Ignore stations too close to the starting point (<50 miles)
-            if station_lat is None or station_lon is None or station_price is None:
-                continue
-
-            if haversine(start_lat, start_lon, station_lat, station_lon) < 50:
-                continue
-
-            station_key = (station_lat, station_lon)
-            if station_key in seen_stations:
-                # **Keep the cheapest station for each location**
-                if station_price < seen_stations[station_key]['price']:
-                    seen_stations[station_key] = station
-            else:
-                seen_stations[station_key] = station
-
-        # **6️⃣ Check for stations near the route**
-        for station in seen_stations.values():
-            for i in range(int(current_mileage), int(next_stop_mileage), 10):  # Scan every 10 miles along the route
-                if i < len(decoded_route):
-                    route_point = decoded_route[i]
-                    station_distance = haversine(route_point[0], route_point[1], station["lat"], station["lon"])
+        # **7️⃣ Find the cheapest station within ROUTE_CORRIDOR_MILES of the route**
+        best_station = None
+        for cell in ordered_cells:
+            if best_station is not None and cell_floors[cell] >= float(best_station['price']):
+                break  # No remaining cell can beat the current best
 
-                    # **Add station if it's within 5 miles of the route**
-                    if station_distance is not None and station_distance <= 5:
-                        candidate_stations.append(station)
+            for station in stations_by_cell[cell]:
+                if best_station is not None and float(station['price']) >= float(best_station['price']):
+                    continue
 
-        # **7️⃣ Select the best fuel station**
-        if candidate_stations:
-            # ✅ **Pick the cheapest station**
-            best_station = min(candidate_stations, key=lambda x: x['price'])
+                for route_point in route_points:
+                    station_distance = haversine(route_point[0], route_point[1], station["lat"], station["lon"])
+                    if station_distance is not None and station_distance <= ROUTE_CORRIDOR_MILES:
+                        best_station = station
+                        break
 
+        # **8️⃣ Select the best fuel station**
+        if best_station is not None:
             # 🚨 **Skip station if it's too close to the previous stop**
             if previous_station:
                 distance_between = haversine(previous_station['lat'], previous_station['lon'], best_station['lat'], best_station['lon'])
                 if distance_between < min_range:
-                    print(f"❌ Skipping {best_station['name']} (Too close to previous station)")
+                    print(f"❌ Skipping {best_station.get('name', best_station['id'])} (Too close to previous station)")
                     current_mileage += 100
                     continue
 
-            print(f"✅ Fuel stop: {best_station['name']} at {best_station['lat']}, {best_station['lon']} - Price: ${best_station['price']}")
+            print(f"✅ Fuel stop: {best_station.get('name', best_station['id'])} at {best_station['lat']}, {best_station['lon']} - Price: ${best_station['price']}")
             optimal_stations.append(best_station)
             previous_station = best_station  # Update the last refueling station
             current_mileage = next_stop_mileage  # Continue from the refueling point
@@ -231,31 +438,6 @@ def get_optimal_fuel_stations(route_data, fuel_stations, max_range=500, min_rang
 
 
 
-def haversine(lat1, lon1, lat2, lon2):
-    """
-    Haversine formula to calculate the great-circle distance between two points on Earth.
-    Formula:
-      a = sin²(Δφ/2) + cos(φ1) ⋅ cos(φ2) ⋅ sin²(Δλ/2)
-      c = 2 ⋅ atan2(√a, √(1−a))
-      d = R ⋅ c
-    Where:
-      - φ1, λ1: Latitude and Longitude of first point (in radians)
-      - φ2, λ2: Latitude and Longitude of second point (in radians)
-      - R = 3959 miles (Earth’s radius)
-    """
-    try:
-        R = 3959  # Earth's radius in miles
-        lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-        return R * c  # Distance in miles
-    except Exception as e:
-        print(f"Error in haversine calculation: {e}")
-        return None
-
-
 def calculate_fuel_cost(route_data, fuel_price_per_gallon):
     """
     Calculates the total fuel cost for the trip.
@@ -264,5 +446,5 @@ def calculate_fuel_cost(route_data, fuel_price_per_gallon):
       total_cost = total_gallons * fuel_price_per_gallon
     """
     total_distance = sum(segment['distance'] for segment in route_data['routes'][0]['segments'])
-    total_fuel_needed = total_distance / 1609.34 / 10  # Convert meters to miles, then divide by MPG
+    total_fuel_needed = total_distance / 1609.34 / DEFAULT_MPG  # Convert meters to miles, then divide by MPG
     return total_fuel_needed * fuel_price_per_gallon
\ No newline at end of file
@@ -0,0 +1,282 @@
+"""
+Columnar fast-path reader for the OPIS fuel price CSV.
+
+Shared by `import_fuel_data` and `update-fuel-stations`. Rows are parsed in
+chunks straight into typed columns (array for numbers, lists for text),
+validated on the way, and invalid rows are collected as RejectedRow instead
+of aborting the import. The commands write each chunk as soon as it is
+parsed; only the OPIS id dedup index is kept across chunks.
+"""
+import csv
+from array import array
+from collections import namedtuple
+from contextlib import contextmanager
+from time import perf_counter
+
+from .models import FuelStation, as_price
+
+CHUNK_SIZE = 5000
+
+# CSV header names
+OPIS_ID = "OPIS Truckstop ID"
+NAME = "Truckstop Name"
+ADDRESS = "Address"
+CITY = "City"
+STATE = "State"
+PRICE = "Retail Price"
+
+REQUIRED_COLUMNS = (OPIS_ID, NAME, ADDRESS, CITY, STATE, PRICE)
+
+# FuelStation.price is DecimalField(max_digits=5, decimal_places=3)
+MAX_PRICE = 99.999
+
+RejectedRow = namedtuple("RejectedRow", ["line", "reason", "row"])
+
+StationRow = namedtuple("StationRow", ["line", "opis_id", "name", "address", "city", "state", "price"])
+
+
+class FuelPriceColumns:
+    """A batch of parsed rows stored column by column."""
+
+    def __init__(self):
+        self.lines = array("l")
+        self.opis_ids = array("q")
+        self.names = []
+        self.addresses = []
+        self.cities = []
+        self.states = []
+        self.prices = array("d")
+
+    def __len__(self):
+        return len(self.lines)
+
+    def append(self, line, opis_id, name, address, city, state, price):
+        self.lines.append(line)
+        self.opis_ids.append(opis_id)
+        self.names.append(name)
+        self.addresses.append(address)
+        self.cities.append(city)
+        self.states.append(state)
+        self.prices.append(price)
+
+    def take(self, indices):
+        """Returns a new batch with only the rows at `indices`."""
+        taken = FuelPriceColumns()
+        for i in indices:
+            taken.append(self.lines[i], self.opis_ids[i], self.names[i], self.addresses[i],
+                         self.cities[i], self.states[i], self.prices[i])
+        return taken
+
+    def rows(self):
+        return map(StationRow, self.lines, self.opis_ids, self.names, self.addresses,
+                   self.cities, self.states, self.prices)
+
+
+class FuelPriceReader:
+    """
+    Iterates over a fuel price CSV in FuelPriceColumns chunks.
+    Rows that fail validation are skipped and recorded in `rejected`.
+    """
+
+    def __init__(self, path, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.rejected = []
+        self.total_rows = 0
+
+    def __iter__(self):
+        with open(self.path, newline="", encoding="utf-8") as file:
+            reader = csv.reader(file)
+            header = next(reader, None) or []
+            missing = [column for column in REQUIRED_COLUMNS if column not in header]
+            if missing:
+                raise ValueError(f"CSV is missing columns: {', '.join(missing)}")
+
+            n_columns = len(header)
+            i_opis, i_name, i_address, i_city, i_state, i_price = (header.index(c) for c in REQUIRED_COLUMNS)
+
+            chunk = FuelPriceColumns()
+            for line, row in enumerate(reader, start=2):
+                self.total_rows += 1
+                if len(row) != n_columns:
+                    self.rejected.append(RejectedRow(line, f"expected {n_columns} fields, got {len(row)}", row))
+                    continue
+
+                name = row[i_name].strip()
+                address = row[i_address].strip()
+                city = row[i_city].strip()
+                state = row[i_state].strip().upper()
+                if not (name and address and city):
+                    self.rejected.append(RejectedRow(line, "missing name, address or city", row))
+                    continue
+                if len(state) != 2 or not state.isalpha():
+                    self.rejected.append(RejectedRow(line, f"invalid state {row[i_state]!r}", row))
+                    continue
+
+                try:
+                    opis_id = int(row[i_opis])
+                except ValueError:
+                    self.rejected.append(RejectedRow(line, f"invalid OPIS id {row[i_opis]!r}", row))
+                    continue
+                try:
+                    price = float(row[i_price])
+                except ValueError:
+                    self.rejected.append(RejectedRow(line, f"invalid price {row[i_price]!r}", row))
+                    continue
+                if not 0 < price <= MAX_PRICE:
+                    self.rejected.append(RejectedRow(line, f"price out of range {price}", row))
+                    continue
+
+                chunk.append(line, opis_id, name, address, city, state, price)
+                if len(chunk) >= self.chunk_size:
+                    yield chunk
+                    chunk = FuelPriceColumns()
+
+            if len(chunk):
+                yield chunk
+
+
+def dedupe_by_station(columns):
+    """
+    The OPIS file lists some truck stops several times (one row per rack/price).
+    Keeps one row per OPIS id, the cheapest one, in first-seen order.
+    """
+    kept = {}
+    prices = columns.prices
+    for i, opis_id in enumerate(columns.opis_ids):
+        j = kept.get(opis_id)
+        if j is None or prices[i] < prices[j]:
+            kept[opis_id] = i
+    return columns.take(sorted(kept.values()))
+
+
+def write_rejected_rows(path, rejected):
+    """Writes rejected rows to a CSV file (line, reason, original fields)."""
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["line", "reason", "row"])
+        for rejected_row in rejected:
+            writer.writerow([rejected_row.line, rejected_row.reason, *rejected_row.row])
+
+
+class StationDedupIndex:
+    """
+    Running OPIS id index for chunked imports: remembers the row stored for every
+    station seen so far, so each chunk can be written as soon as it is parsed.
+    """
+
+    def __init__(self):
+        self.stored = {}
+        self.valid_rows = 0
+        self.merged = 0
+
+    def split(self, chunk):
+        """
+        Deduplicates `chunk` against itself and the earlier chunks.
+
+        Returns:
+            (new, cheaper): `new` holds the stations seen for the first time (FuelPriceColumns),
+            `cheaper` is a list of (StationRow, stored StationRow) for stations stored from an
+            earlier chunk whose new row has a lower price.
+        """
+        self.valid_rows += len(chunk)
+        deduped = dedupe_by_station(chunk)
+        self.merged += len(chunk) - len(deduped)
+
+        new_indices = []
+        cheaper = []
+        for i, row in enumerate(deduped.rows()):
+            stored = self.stored.get(row.opis_id)
+            if stored is None:
+                new_indices.append(i)
+                self.stored[row.opis_id] = row
+                continue
+            self.merged += 1
+            if row.price < stored.price:
+                cheaper.append((row, stored))
+                self.stored[row.opis_id] = stored._replace(price=row.price)
+        return deduped.take(new_indices), cheaper
+
+    def forget(self, opis_id):
+        """Drops a station that wasn't saved (e.g. not geocoded), so a later row for it counts as new."""
+        self.stored.pop(opis_id, None)
+
+
+# Stored stations are looked up and updated in batches (SQLite query parameter limit)
+REPRICE_BATCH_SIZE = 500
+
+
+def reprice_stations(cheaper):
+    """
+    Lowers the stored price of stations whose cheapest row arrived in a later chunk
+    (the output of StationDedupIndex.split). Rows are found by OPIS id and written
+    with bulk_update. Returns the number of rows updated.
+    """
+    prices = {row.opis_id: as_price(row.price) for row, _ in cheaper}
+    opis_ids = list(prices)
+    stations = []
+    for start in range(0, len(opis_ids), REPRICE_BATCH_SIZE):
+        batch = FuelStation.objects.filter(opis_id__in=opis_ids[start:start + REPRICE_BATCH_SIZE]).only("id", "opis_id")
+        for station in batch:
+            station.price = prices[station.opis_id]
+            stations.append(station)
+    if stations:
+        FuelStation.objects.bulk_update(stations, ["price"], batch_size=REPRICE_BATCH_SIZE)
+    return len(stations)
+
+
+def add_import_arguments(parser, chunk_size=CHUNK_SIZE):
+    """Options shared by the CSV import commands."""
+    parser.add_argument("--profile", action="store_true",
+                        help="Print per-phase timings (parse, dedup, geocode, DB write) and rows/sec")
+    parser.add_argument("--chunk-size", type=int, default=chunk_size,
+                        help="Number of CSV rows parsed and written per chunk")
+    parser.add_argument("--rejected-output", default=None,
+                        help="Write rows that failed validation to this CSV file")
+
+
+def report_import(reader, dedup, options, stdout):
+    """Prints a summary of the parsed, rejected and merged rows once the reader is exhausted."""
+    stdout.write(f"Parsed {reader.total_rows} rows: {dedup.valid_rows} valid, {len(reader.rejected)} rejected, "
+                 f"{dedup.merged} duplicates merged")
+    for rejected in reader.rejected[:10]:
+        stdout.write(f"⚠️ Line {rejected.line}: {rejected.reason}")
+    if len(reader.rejected) > 10:
+        stdout.write(f"⚠️ ... and {len(reader.rejected) - 10} more rejected rows")
+    if reader.rejected and options["rejected_output"]:
+        write_rejected_rows(options["rejected_output"], reader.rejected)
+        stdout.write(f"Rejected rows written to {options['rejected_output']}")
+
+
+class ImportProfile:
+    """Collects per-phase wall-clock timings for the import commands (`--profile`)."""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + perf_counter() - start
+
+    def timed_iter(self, name, iterable):
+        """Iterates over `iterable`, charging the time spent producing each item to `name`."""
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                item = next(iterator, None)
+            if item is None:
+                return
+            yield item
+
+    def report(self, rows):
+        """Returns the report lines: one per phase plus the total, with rows/sec."""
+        lines = []
+        total = sum(self.timings.values())
+        for name, seconds in list(self.timings.items()) + [("total", total)]:
+            rate = rows / seconds if seconds > 0 else float("inf")
+            lines.append(f"⏱️ {name:<10} {seconds:8.3f}s  {rate:12,.0f} rows/sec")
+        return lines
@@ -0,0 +1,47 @@
+"""
+Station-data version token.
+
+Every write to the station data (model save/delete, queryset update/bulk
+writes, price aggregate refreshes, snapshot file swaps) replaces the token
+stored in the response cache. Cached responses and in-memory station indexes are keyed on it, so
+reading the current version is a single cache lookup with no database query.
+
+The token lives in `settings.FUEL_ROUTE_CACHE_ALIAS`; that cache must be shared
+by all processes (the default file-based cache is) for a write in one process
+to invalidate the others.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+VERSION_KEY = "fuel_route:station_data_version"
+
+
+def _bump():
+    version = (uuid.uuid4().hex, int(time.time()))
+    caches[settings.FUEL_ROUTE_CACHE_ALIAS].set(VERSION_KEY, version, None)
+    return version
+
+
+def bump_station_data_version():
+    """Replaces the version token once the current transaction commits (immediately outside one)."""
+    transaction.on_commit(_bump)
+
+
+def bump_station_data_version_now():
+    """Replaces the version token right away, for station data outside the database (the snapshot file)."""
+    return _bump()
+
+
+def get_station_data_version():
+    """
+    Returns (token, last_modified) where last_modified is the unix time of the last write.
+    A cold cache starts a new version, so nothing cached under an old token is served.
+    """
+    version = caches[settings.FUEL_ROUTE_CACHE_ALIAS].get(VERSION_KEY)
+    if version is None:
+        version = _bump()
+    return version
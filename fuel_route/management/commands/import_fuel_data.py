@@ -1,23 +1,55 @@
-import csv
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from fuel_route.models import FuelStation
+from fuel_route.snapshot import refresh_station_snapshot
+from fuel_route.aggregates import refresh_price_aggregates
+from fuel_route.csv_import import (
+    FuelPriceReader, ImportProfile, StationDedupIndex, add_import_arguments, report_import, reprice_stations,
+)
 import os
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CSV_PATH = os.path.join(BASE_DIR, "management", "commands", "data", "fuel-prices-for-be-assessment.csv")
+
 
 class Command(BaseCommand):
     help = "Import fuel station data from CSV file"
 
-    def handle(self, *args, **kwargs):
-        csv_file = os.path.join(BASE_DIR, "management", "commands","data", "fuel-prices-for-be-assessment.csv")
-        with open(csv_file, newline='', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                FuelStation.objects.create(
-                    name=row["Truckstop Name"],
-                    address=row["Address"],
-                    city=row["City"],
-                    state=row["State"],
-                    price=float(row["Retail Price"]),
+    def add_arguments(self, parser):
+        add_import_arguments(parser)
+
+    def handle(self, *args, **options):
+        profile = ImportProfile()
+        reader = FuelPriceReader(CSV_PATH, options["chunk_size"])
+        dedup = StationDedupIndex()
+        touched_states = set()
+
+        # Each chunk is committed as soon as it is parsed
+        for chunk in profile.timed_iter("parse", reader):
+            with profile.phase("dedup"):
+                new, cheaper = dedup.split(chunk)
+
+            with profile.phase("db write"), transaction.atomic():
+                FuelStation.objects.bulk_create(
+                    (
+                        FuelStation(name=row.name, address=row.address, city=row.city, state=row.state,
+                                    price=row.price, opis_id=row.opis_id)
+                        for row in new.rows()
+                    ),
+                    batch_size=1000,
                 )
+                reprice_stations(cheaper)
+            touched_states.update(new.states)
+            touched_states.update(stored.state for _, stored in cheaper)
+
+        report_import(reader, dedup, options, self.stdout)
+
+        with profile.phase("refresh"):
+            # Imported stations have no coordinates yet, so only the state aggregates change
+            refresh_price_aggregates(states=touched_states, cells=set())
+            refresh_station_snapshot()
+
+        if options["profile"]:
+            for line in profile.report(reader.total_rows):
+                self.stdout.write(line)
         self.stdout.write(self.style.SUCCESS("Fuel stations imported successfully!"))
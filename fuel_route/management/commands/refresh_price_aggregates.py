@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from fuel_route.aggregates import refresh_price_aggregates
+
+
+class Command(BaseCommand):
+    help = "Rebuild the state and grid cell price aggregates from all fuel stations"
+
+    def handle(self, *args, **kwargs):
+        refresh_price_aggregates()
+        self.stdout.write(self.style.SUCCESS("Price aggregates refreshed!"))
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from fuel_route.models import FuelStation
+from fuel_route.snapshot import write_snapshot
+from fuel_route.spatial import GRID_CELL_DEGREES
+
+
+class Command(BaseCommand):
+    help = (
+        "Write geocoded fuel stations (id/lat/lon/price + spatial grid) to a memory-mapped "
+        "snapshot file. Once the file exists, the importers refresh it automatically."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=None,
+                            help="Snapshot path (default: settings.STATION_SNAPSHOT_PATH)")
+        parser.add_argument("--cell-size", type=float, default=GRID_CELL_DEGREES,
+                            help="Grid cell size in degrees")
+
+    def handle(self, *args, **options):
+        path = options["output"] or settings.STATION_SNAPSHOT_PATH
+        stations = FuelStation.objects.filter(lat__isnull=False, lon__isnull=False) \
+            .values_list("id", "lat", "lon", "price").iterator()
+        count = write_snapshot(path, stations, options["cell_size"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} stations to {path}"))
@@ -1,51 +1,88 @@
 # fuel_route/management/commands/update_fuel_stations.py
-import csv
 import os
 import time
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from fuel_route.models import FuelStation
 from fuel_route.geocoding import get_lat_lon_from_address
+from fuel_route.snapshot import refresh_station_snapshot
+from fuel_route.aggregates import refresh_price_aggregates
+from fuel_route.csv_import import (
+    FuelPriceReader, ImportProfile, StationDedupIndex, add_import_arguments, report_import, reprice_stations,
+)
+from fuel_route.spatial import grid_cell
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 CSV_PATH = os.path.join(BASE_DIR, "management", "commands", "data", "fuel-prices-for-be-assessment.csv")
 
+# Geocoding takes ~0.2 sec per row, so chunks are small to commit progress often
+GEOCODE_CHUNK_SIZE = 100
+
 class Command(BaseCommand):
     help = "Update fuel stations with latitude and longitude from the CSV file"
 
-    def handle(self, *args, **kwargs):
-        with open(CSV_PATH, "r") as file:
-            reader = csv.DictReader(file)
-            total = sum(1 for _ in reader)  # Find total row number
-            file.seek(0)  # Get back to head
-            next(reader)  # Pass the header
-
-            for i, row in enumerate(reader, start=1):
-                name = row["Truckstop Name"]
-                address = row["Address"]
-                city = row["City"]
-                state = row["State"]
-                price = float(row["Retail Price"])
-
-                # Get lan/lon from Mapbox
-                lat, lon = get_lat_lon_from_address(address, city, state)
-
-                if lat is None or lon is None:
-                    print(f"⚠️ {name} için konum bulunamadı, atlanıyor...")
-                    continue  # Don't save it if there is no Lat/Lon 
-
-                # Save it to db
-                FuelStation.objects.create(
-                    name=name,
-                    address=address,
-                    city=city,
-                    state=state,
-                    price=price,
-                    lat=lat,
-                    lon=lon
+    def add_arguments(self, parser):
+        add_import_arguments(parser, chunk_size=GEOCODE_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        profile = ImportProfile()
+        reader = FuelPriceReader(CSV_PATH, options["chunk_size"])
+        dedup = StationDedupIndex()
+        cells_by_station = {}
+        touched_states = set()
+        touched_cells = set()
+        saved = 0
+
+        for chunk in profile.timed_iter("parse", reader):
+            with profile.phase("dedup"):
+                new, cheaper = dedup.split(chunk)
+
+            geocoded = []
+            with profile.phase("geocode"):
+                for row in new.rows():
+                    # Get lan/lon from Mapbox
+                    lat, lon = get_lat_lon_from_address(row.address, row.city, row.state)
+
+                    if lat is None or lon is None:
+                        print(f"⚠️ {row.name} için konum bulunamadı, atlanıyor...")
+                        dedup.forget(row.opis_id)
+                        continue  # Don't save it if there is no Lat/Lon
+
+                    geocoded.append((row, lat, lon))
+                    print(f"✅ [line {row.line}] {row.name} ({row.city}, {row.state}) located: {lat}, {lon}")
+                    # Waiting for 0.2 sec for API rates
+                    time.sleep(0.2)
+
+            # Save the chunk to db, so an interrupted run keeps the stations geocoded so far
+            with profile.phase("db write"), transaction.atomic():
+                FuelStation.objects.bulk_create(
+                    (
+                        FuelStation(name=row.name, address=row.address, city=row.city, state=row.state,
+                                    price=row.price, lat=lat, lon=lon, opis_id=row.opis_id)
+                        for row, lat, lon in geocoded
+                    ),
+                    batch_size=1000,
                 )
+                reprice_stations(cheaper)
+            saved += len(geocoded)
+            print(f"💾 {saved} stations saved")
+
+            for row, lat, lon in geocoded:
+                cells_by_station[row.opis_id] = grid_cell(lat, lon)
+                touched_states.add(row.state)
+                touched_cells.add(cells_by_station[row.opis_id])
+            for _, stored in cheaper:
+                touched_states.add(stored.state)
+                if stored.opis_id in cells_by_station:
+                    touched_cells.add(cells_by_station[stored.opis_id])
+
+        report_import(reader, dedup, options, self.stdout)
 
-                print(f"✅ [{i}/{total}] {name} ({city}, {state}) saved: {lat}, {lon}")
-                # Waiting for 0.2 sec for API rates
-                time.sleep(0.2)
+        with profile.phase("refresh"):
+            refresh_price_aggregates(states=touched_states, cells=touched_cells)
+            refresh_station_snapshot()
 
+        if options["profile"]:
+            for line in profile.report(reader.total_rows):
+                self.stdout.write(line)
         print("🔥 All fuel stations successfully updated")
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.23 on 2026-10-19 04:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fuel_route', '0005_auto_20250213_1215'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatePriceAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(max_length=2, unique=True)),
+                ('station_count', models.IntegerField()),
+                ('min_price', models.DecimalField(decimal_places=3, max_digits=5)),
+                ('p10_price', models.DecimalField(decimal_places=3, max_digits=5)),
+                ('median_price', models.DecimalField(decimal_places=3, max_digits=5)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GridCellPriceAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row', models.IntegerField()),
+                ('col', models.IntegerField()),
+                ('station_count', models.IntegerField()),
+                ('min_price', models.DecimalField(decimal_places=3, max_digits=5)),
+                ('p10_price', models.DecimalField(decimal_places=3, max_digits=5)),
+                ('median_price', models.DecimalField(decimal_places=3, max_digits=5)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('row', 'col')},
+            },
+        ),
+        migrations.CreateModel(
+            name='GridCellState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(max_length=2)),
+                ('cell', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='states', to='fuel_route.gridcellpriceaggregate')),
+            ],
+            options={
+                'unique_together': {('cell', 'state')},
+            },
+        ),
+    ]
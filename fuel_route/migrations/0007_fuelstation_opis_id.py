@@ -0,0 +1,18 @@
+# Generated by Django 3.2.23 on 2026-10-19 04:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fuel_route', '0006_price_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fuelstation',
+            name='opis_id',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
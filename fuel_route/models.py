@@ -1,4 +1,35 @@
+from decimal import Decimal
+
 from django.db import models
+from .data_version import bump_station_data_version
+
+# FuelStation.price has 3 decimal places
+PRICE_STEP = Decimal("0.001")
+
+
+def as_price(value):
+    """Converts a float or Decimal price to the Decimal stored in FuelStation.price."""
+    return Decimal(repr(value) if isinstance(value, float) else value).quantize(PRICE_STEP)
+
+
+class FuelStationQuerySet(models.QuerySet):
+    """Bulk writes skip model signals, so they bump the station-data version themselves."""
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        bump_station_data_version()
+        return rows
+
+    def bulk_create(self, *args, **kwargs):
+        created = super().bulk_create(*args, **kwargs)
+        bump_station_data_version()
+        return created
+
+    def bulk_update(self, *args, **kwargs):
+        rows = super().bulk_update(*args, **kwargs)
+        bump_station_data_version()
+        return rows
+
 
 class FuelStation(models.Model):
     name = models.CharField(max_length=255)
@@ -8,6 +39,10 @@ class FuelStation(models.Model):
     price = models.DecimalField(max_digits=5, decimal_places=3)
     lat = models.FloatField(null=True, blank=True)
     lon = models.FloatField(null=True, blank=True)
+    # OPIS Truckstop ID from the price CSV, used by the importers to find stored rows
+    opis_id = models.BigIntegerField(null=True, blank=True, db_index=True)
+
+    objects = FuelStationQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.name} - {self.city}, {self.state}"
@@ -24,3 +59,45 @@ class Route(models.Model):
 
     def __str__(self):
         return f"Route from ({self.start_lat}, {self.start_lon}) to ({self.end_lat}, {self.end_lon})"
+
+
+class StatePriceAggregate(models.Model):
+    """Materialized price summary per state, refreshed by the importers."""
+    state = models.CharField(max_length=2, unique=True)
+    station_count = models.IntegerField()
+    min_price = models.DecimalField(max_digits=5, decimal_places=3)
+    p10_price = models.DecimalField(max_digits=5, decimal_places=3)
+    median_price = models.DecimalField(max_digits=5, decimal_places=3)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.state}: {self.station_count} stations, median ${self.median_price}"
+
+
+class GridCellPriceAggregate(models.Model):
+    """Materialized price summary per spatial grid cell (see fuel_route.spatial.grid_cell)."""
+    row = models.IntegerField()
+    col = models.IntegerField()
+    station_count = models.IntegerField()
+    min_price = models.DecimalField(max_digits=5, decimal_places=3)
+    p10_price = models.DecimalField(max_digits=5, decimal_places=3)
+    median_price = models.DecimalField(max_digits=5, decimal_places=3)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("row", "col")
+
+    def __str__(self):
+        return f"Cell ({self.row}, {self.col}): {self.station_count} stations, min ${self.min_price}"
+
+
+class GridCellState(models.Model):
+    """States that have at least one station in a grid cell, so cells can be filtered by state in SQL."""
+    cell = models.ForeignKey(GridCellPriceAggregate, on_delete=models.CASCADE, related_name="states")
+    state = models.CharField(max_length=2)
+
+    class Meta:
+        unique_together = ("cell", "state")
+
+    def __str__(self):
+        return f"{self.state} in cell ({self.cell.row}, {self.cell.col})"
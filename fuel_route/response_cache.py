@@ -0,0 +1,70 @@
+"""
+Response cache for the station and route endpoints.
+
+Responses are stored as bytes keyed on the normalized request parameters plus
+the station-data version, so a new import invalidates everything at once.
+Every cached response carries an ETag / Last-Modified pair and unchanged GET
+requests are answered with 304 Not Modified.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .data_version import get_station_data_version
+
+
+def cached_response(key_func):
+    """
+    View decorator that caches successful responses.
+
+    Parameters:
+        key_func: callable(request) returning JSON-serializable normalized parameters,
+                  or None to bypass the cache (e.g. invalid input)
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            params = key_func(request)
+            if params is None:
+                return view(request, *args, **kwargs)
+
+            version, last_modified = get_station_data_version()
+            digest = hashlib.sha256(
+                json.dumps([view.__name__, params, version], sort_keys=True).encode()
+            ).hexdigest()
+            etag = f'"{digest[:32]}"'
+
+            # **Conditional GET: nothing changed since the client's copy**
+            if request.method in ("GET", "HEAD"):
+                not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if not_modified is not None:
+                    return not_modified
+
+            cache = caches[settings.FUEL_ROUTE_CACHE_ALIAS]
+            cache_key = f"fuel_route:response:{digest}"
+            cached = cache.get(cache_key)
+            if cached is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                cached = (response.content, response["Content-Type"])
+                cache.set(cache_key, cached, settings.FUEL_ROUTE_CACHE_TIMEOUT)
+
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def no_params_key(request):
+    """Cache key parameters for views that don't read the query string (ignores cache-busting params)."""
+    return {}
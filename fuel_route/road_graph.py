@@ -0,0 +1,193 @@
+"""
+Local road-graph routing engine.
+
+Loads a prebuilt road graph (e.g. a simplified interstate network) into compact
+arrays and answers shortest-path queries with A* (great-circle heuristic), so
+routes can be planned without calling OpenRouteService.
+
+Graph file format (JSON):
+
+    {
+        "nodes": [[lat, lon], ...],
+        "edges": [[from_index, to_index], [from_index, to_index, distance_meters], ...]
+    }
+
+Edges are two-way. When the distance is omitted, the great-circle distance
+between the two nodes is used.
+"""
+import heapq
+import json
+import os
+from array import array
+
+import polyline
+
+from .spatial import haversine, grid_cell, cells_within
+
+METERS_PER_MILE = 1609.34
+
+# The optimizer samples the decoded geometry assuming roughly one point per mile,
+# so long edges are densified to this spacing before encoding.
+GEOMETRY_STEP_MILES = 1.0
+
+# Search radii (miles) used to snap start/end coordinates onto the graph
+SNAP_RADII_MILES = (5, 25, 100, 400)
+
+
+class RoadGraph:
+    """Road network stored in CSR (compressed sparse row) form."""
+
+    def __init__(self, nodes, edges):
+        self.lats = array("d", (lat for lat, _ in nodes))
+        self.lons = array("d", (lon for _, lon in nodes))
+        n = len(nodes)
+
+        # **1️⃣ Count the degree of every node (edges are two-way)**
+        degree = [0] * n
+        for edge in edges:
+            degree[edge[0]] += 1
+            degree[edge[1]] += 1
+
+        self.offsets = array("l", [0] * (n + 1))
+        for i in range(n):
+            self.offsets[i + 1] = self.offsets[i] + degree[i]
+
+        # **2️⃣ Fill the adjacency arrays**
+        self.targets = array("l", [0] * self.offsets[n])
+        self.weights = array("d", [0.0] * self.offsets[n])
+        cursor = array("l", self.offsets[:n])
+        for edge in edges:
+            u, v = edge[0], edge[1]
+            distance = edge[2] if len(edge) > 2 else \
+                haversine(self.lats[u], self.lons[u], self.lats[v], self.lons[v]) * METERS_PER_MILE
+            for a, b in ((u, v), (v, u)):
+                self.targets[cursor[a]] = b
+                self.weights[cursor[a]] = distance
+                cursor[a] += 1
+
+        # **3️⃣ Spatial grid for snapping coordinates to the nearest node**
+        self.grid = {}
+        for i in range(n):
+            self.grid.setdefault(grid_cell(self.lats[i], self.lons[i]), []).append(i)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as file:
+            data = json.load(file)
+        return cls(data["nodes"], data["edges"])
+
+    def __len__(self):
+        return len(self.lats)
+
+    def nearest_node(self, lat, lon):
+        """Returns (node, distance_miles) of the closest node, or (None, None) if the graph is too far away."""
+        for radius in SNAP_RADII_MILES:
+            best, best_distance = None, None
+            row_min, row_max, col_min, col_max = cells_within(lat, lon, radius)
+            for row in range(row_min, row_max + 1):
+                for col in range(col_min, col_max + 1):
+                    for i in self.grid.get((row, col), ()):
+                        distance = haversine(lat, lon, self.lats[i], self.lons[i])
+                        if distance <= radius and (best_distance is None or distance < best_distance):
+                            best, best_distance = i, distance
+            if best is not None:
+                return best, best_distance
+        return None, None
+
+    def shortest_path(self, source, target):
+        """
+        A* search from `source` to `target`.
+        The heuristic is the great-circle distance, which never overestimates road distance.
+
+        Returns:
+            (path, distance_meters), or (None, None) if the nodes aren't connected
+        """
+        lats, lons = self.lats, self.lons
+        offsets, targets, weights = self.offsets, self.targets, self.weights
+        target_lat, target_lon = lats[target], lons[target]
+
+        def heuristic(node):
+            return haversine(lats[node], lons[node], target_lat, target_lon) * METERS_PER_MILE
+
+        best = {source: 0.0}
+        previous = {}
+        queue = [(heuristic(source), 0.0, source)]
+        closed = set()
+
+        while queue:
+            _, distance, node = heapq.heappop(queue)
+            if node == target:
+                path = [node]
+                while node != source:
+                    node = previous[node]
+                    path.append(node)
+                path.reverse()
+                return path, distance
+            if node in closed:
+                continue
+            closed.add(node)
+
+            for e in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[e]
+                candidate = distance + weights[e]
+                if candidate < best.get(neighbour, float("inf")):
+                    best[neighbour] = candidate
+                    previous[neighbour] = node
+                    heapq.heappush(queue, (candidate + heuristic(neighbour), candidate, neighbour))
+
+        return None, None
+
+    def path_geometry(self, points):
+        """Densifies a list of (lat, lon) points to about one point per GEOMETRY_STEP_MILES."""
+        geometry = [points[0]]
+        for (lat1, lon1), (lat2, lon2) in zip(points, points[1:]):
+            steps = max(1, int(haversine(lat1, lon1, lat2, lon2) / GEOMETRY_STEP_MILES))
+            for s in range(1, steps + 1):
+                t = s / steps
+                geometry.append((lat1 + (lat2 - lat1) * t, lon1 + (lon2 - lon1) * t))
+        return geometry
+
+
+_loaded = {"key": None, "graph": None}
+
+
+def road_graph_key(path):
+    """Identifies the current version of the graph file (path, inode, mtime, size); raises OSError if missing."""
+    stat = os.stat(path)
+    return path, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def get_road_graph(path):
+    """Returns the process-wide road graph, reloading it when the file changes."""
+    key = road_graph_key(path)
+    if _loaded["key"] != key:
+        _loaded["graph"] = RoadGraph.load(path)
+        _loaded["key"] = key
+    return _loaded["graph"]
+
+
+def route_on_graph(graph, start_lat, start_lon, end_lat, end_lon):
+    """
+    Routes between two coordinates on the graph.
+
+    Returns:
+        route data shaped like the OpenRouteService response, or None if no route exists
+    """
+    source, start_snap = graph.nearest_node(start_lat, start_lon)
+    target, end_snap = graph.nearest_node(end_lat, end_lon)
+    if source is None or target is None:
+        return None
+
+    path, path_distance = graph.shortest_path(source, target)
+    if path is None:
+        return None
+
+    points = [(start_lat, start_lon)] + [(graph.lats[i], graph.lons[i]) for i in path] + [(end_lat, end_lon)]
+    distance = path_distance + (start_snap + end_snap) * METERS_PER_MILE
+    return {
+        "routes": [{
+            "geometry": polyline.encode(graph.path_geometry(points)),
+            "summary": {"distance": distance},
+            "segments": [{"distance": distance}],
+        }]
+    }
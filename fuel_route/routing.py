@@ -0,0 +1,89 @@
+"""
+Pluggable routing backends used by `calculate_route`.
+
+Every backend returns route data shaped like the OpenRouteService directions
+response, which is what the optimizer consumes:
+
+    {"routes": [{"geometry": <encoded polyline>,
+                 "summary": {"distance": meters},
+                 "segments": [{"distance": meters}, ...]}]}
+
+The backend is selected with `settings.ROUTING_BACKEND` ("ors" or "local").
+"""
+import math
+from abc import ABC, abstractmethod
+
+import requests
+from django.conf import settings
+
+from .road_graph import get_road_graph, route_on_graph
+
+
+class RoutingError(Exception):
+    """Raised when a backend can't produce a route."""
+
+
+class RoutingBackend(ABC):
+    """Base class for routing backends."""
+
+    @abstractmethod
+    def route(self, start_lat, start_lon, end_lat, end_lon):
+        """Returns ORS-shaped route data, or raises RoutingError."""
+
+
+class ORSBackend(RoutingBackend):
+    """Routes through the OpenRouteService directions API (needs ORS_API_KEY)."""
+
+    url = "https://api.openrouteservice.org/v2/directions/driving-car"
+
+    def route(self, start_lat, start_lon, end_lat, end_lon):
+        payload = {"coordinates": [[start_lon, start_lat], [end_lon, end_lat]]}
+        headers = {"Authorization": settings.ORS_API_KEY}
+        try:
+            response = requests.post(self.url, json=payload, headers=headers, timeout=settings.ORS_TIMEOUT)
+            if response.status_code != 200:
+                raise RoutingError("Error fetching route data from ORS")
+            return response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise RoutingError(f"Error fetching route data from ORS: {e}")
+
+
+class LocalGraphBackend(RoutingBackend):
+    """Routes on a prebuilt road graph file (settings.ROAD_GRAPH_PATH) without network access."""
+
+    def route(self, start_lat, start_lon, end_lat, end_lon):
+        try:
+            graph = get_road_graph(settings.ROAD_GRAPH_PATH)
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+            raise RoutingError(f"Error loading road graph: {e}")
+
+        try:
+            coordinates = [float(value) for value in (start_lat, start_lon, end_lat, end_lon)]
+        except (TypeError, ValueError):
+            raise RoutingError("Invalid coordinates")
+        # json.loads accepts NaN and Infinity, which the spatial grid can't place
+        if not all(math.isfinite(value) for value in coordinates):
+            raise RoutingError("Invalid coordinates: values must be finite")
+        lats, lons = coordinates[0::2], coordinates[1::2]
+        if not (all(-90 <= lat <= 90 for lat in lats) and all(-180 <= lon <= 180 for lon in lons)):
+            raise RoutingError("Invalid coordinates: lat must be in [-90, 90] and lon in [-180, 180]")
+
+        route_data = route_on_graph(graph, *coordinates)
+        if route_data is None:
+            raise RoutingError("No route found in the local road graph")
+        return route_data
+
+
+ROUTING_BACKENDS = {
+    "ors": ORSBackend,
+    "local": LocalGraphBackend,
+}
+
+
+def get_routing_backend(name=None):
+    """Returns an instance of the configured routing backend."""
+    name = name or settings.ROUTING_BACKEND
+    try:
+        return ROUTING_BACKENDS[name]()
+    except KeyError:
+        raise RoutingError(f"Unknown routing backend: {name}")
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .data_version import bump_station_data_version
+from .models import FuelStation
+
+
+@receiver(post_save, sender=FuelStation)
+@receiver(post_delete, sender=FuelStation)
+def station_changed(sender, **kwargs):
+    """Single-row writes (admin edits, save(), delete()) invalidate cached station data."""
+    bump_station_data_version()
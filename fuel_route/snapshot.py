@@ -0,0 +1,247 @@
+"""
+Memory-mapped station snapshot.
+
+The snapshot is a read-only binary copy of every geocoded fuel station
+(id / lat / lon / price) plus a prebuilt spatial grid. Workers map the file
+with `mmap`, so all gunicorn/uvicorn processes share the same pages and
+startup costs nothing beyond an `open()`.
+
+File layout (little-endian, every array section is 8-byte aligned):
+
+    header     HEADER struct (see below)
+    ids        int64   × count
+    lats       float64 × count
+    lons       float64 × count
+    prices     float64 × count
+    cell_start uint32  × (rows * cols + 1)
+
+Stations are sorted by grid cell, so the stations of cell `c` are the slice
+`cell_start[c]:cell_start[c + 1]` of every column.
+"""
+import mmap
+import os
+import struct
+import time
+from array import array
+
+from django.conf import settings
+
+from .data_version import bump_station_data_version_now, get_station_data_version
+from .models import FuelStation, as_price
+from .spatial import GRID_CELL_DEGREES, grid_cell, cells_within, haversine
+
+MAGIC = b"FUELSNAP"
+FORMAT_VERSION = 1
+
+# magic, format version, station count, generated at (unix time), cell size (degrees),
+# first grid row, first grid col, grid rows, grid cols
+HEADER = struct.Struct("<8sIIdd4i")
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is missing, truncated or of an unknown version."""
+
+
+def build_snapshot(stations, cell_degrees=GRID_CELL_DEGREES):
+    """
+    Serializes stations into the snapshot binary format.
+
+    Parameters:
+        stations: iterable of (id, lat, lon, price) tuples; rows without lat/lon are skipped
+        cell_degrees: grid cell size in degrees
+
+    Returns:
+        bytes ready to be written to disk (or wrapped by StationSnapshot directly)
+    """
+    rows = [
+        (grid_cell(lat, lon, cell_degrees), station_id, lat, lon, float(price))
+        for station_id, lat, lon, price in stations
+        if lat is not None and lon is not None
+    ]
+    rows.sort(key=lambda r: r[0])
+
+    if rows:
+        row0 = min(r[0][0] for r in rows)
+        col0 = min(r[0][1] for r in rows)
+        n_rows = max(r[0][0] for r in rows) - row0 + 1
+        n_cols = max(r[0][1] for r in rows) - col0 + 1
+    else:
+        row0 = col0 = n_rows = n_cols = 0
+
+    # **Count stations per cell, then turn counts into start offsets**
+    cell_start = array("I", bytes(4 * (n_rows * n_cols + 1)))
+    for (row, col), *_ in rows:
+        cell_start[(row - row0) * n_cols + (col - col0) + 1] += 1
+    for i in range(1, len(cell_start)):
+        cell_start[i] += cell_start[i - 1]
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(rows), time.time(), cell_degrees,
+                         row0, col0, n_rows, n_cols)
+    return b"".join([
+        header,
+        array("q", [r[1] for r in rows]).tobytes(),
+        array("d", [r[2] for r in rows]).tobytes(),
+        array("d", [r[3] for r in rows]).tobytes(),
+        array("d", [r[4] for r in rows]).tobytes(),
+        cell_start.tobytes(),
+    ])
+
+
+def write_snapshot(path, stations, cell_degrees=GRID_CELL_DEGREES):
+    """
+    Writes a snapshot next to `path` and atomically swaps it into place.
+    Readers that already mapped the old file keep their pages until they reload.
+    The station data version changes after the swap, so responses computed from
+    the old file are never served under the new version.
+    """
+    data = build_snapshot(stations, cell_degrees)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    bump_station_data_version_now()
+    return HEADER.unpack_from(data)[2]
+
+
+class StationSnapshot:
+    """
+    Read-only view over a snapshot buffer (an mmap or plain bytes).
+    The columns are zero-copy memoryviews into the buffer.
+    """
+
+    def __init__(self, buffer):
+        if len(buffer) < HEADER.size:
+            raise SnapshotError("Snapshot is truncated")
+        (magic, version, count, generated_at, cell_degrees,
+         row0, col0, n_rows, n_cols) = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise SnapshotError("Not a fuel station snapshot")
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"Unsupported snapshot version {version}")
+
+        expected = HEADER.size + 32 * count + 4 * (n_rows * n_cols + 1)
+        if len(buffer) < expected:
+            raise SnapshotError("Snapshot is truncated")
+
+        self._buffer = buffer
+        self.generated_at = generated_at
+        self.cell_degrees = cell_degrees
+        self.row0, self.col0 = row0, col0
+        self.n_rows, self.n_cols = n_rows, n_cols
+
+        view = memoryview(buffer)
+        offset = HEADER.size
+        self.ids = view[offset:offset + 8 * count].cast("q")
+        offset += 8 * count
+        self.lats = view[offset:offset + 8 * count].cast("d")
+        offset += 8 * count
+        self.lons = view[offset:offset + 8 * count].cast("d")
+        offset += 8 * count
+        self.prices = view[offset:offset + 8 * count].cast("d")
+        offset += 8 * count
+        self.cell_start = view[offset:offset + 4 * (n_rows * n_cols + 1)].cast("I")
+
+    @classmethod
+    def open(cls, path):
+        """Maps a snapshot file read-only."""
+        with open(path, "rb") as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def cell_range(self, row, col):
+        """Returns the (start, end) station slice for a grid cell, empty if outside the grid."""
+        r = row - self.row0
+        c = col - self.col0
+        if not (0 <= r < self.n_rows and 0 <= c < self.n_cols):
+            return 0, 0
+        cell = r * self.n_cols + c
+        return self.cell_start[cell], self.cell_start[cell + 1]
+
+    def indices_near(self, lat, lon, radius_miles):
+        """Yields (index, distance_miles) for every station within `radius_miles` of a point."""
+        row_min, row_max, col_min, col_max = cells_within(lat, lon, radius_miles, self.cell_degrees)
+        lats, lons = self.lats, self.lons
+        for row in range(max(row_min, self.row0), min(row_max, self.row0 + self.n_rows - 1) + 1):
+            for col in range(max(col_min, self.col0), min(col_max, self.col0 + self.n_cols - 1) + 1):
+                start, end = self.cell_range(row, col)
+                for i in range(start, end):
+                    distance = haversine(lat, lon, lats[i], lons[i])
+                    if distance <= radius_miles:
+                        yield i, distance
+
+    def station(self, i):
+        """
+        Returns station `i` as a dict shaped like `FuelStation.objects.values()`.
+        The price is converted back to a Decimal so responses serialize it like the database path.
+        """
+        return {"id": self.ids[i], "lat": self.lats[i], "lon": self.lons[i], "price": as_price(self.prices[i])}
+
+
+_loaded = {"key": None, "snapshot": None}
+
+
+def get_station_snapshot(path=None):
+    """
+    Returns the process-wide snapshot mapped from `settings.STATION_SNAPSHOT_PATH`,
+    or None if no snapshot has been generated.
+    The file is remapped automatically after it has been swapped by a new import.
+    """
+    path = path or settings.STATION_SNAPSHOT_PATH
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    key = (path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if _loaded["key"] != key:
+        try:
+            _loaded["snapshot"] = StationSnapshot.open(path)
+        except (OSError, ValueError, SnapshotError) as e:
+            print(f"⚠️ Could not load station snapshot {path}: {e}")
+            return None
+        _loaded["key"] = key
+    return _loaded["snapshot"]
+
+
+_db_index = {"version": None, "snapshot": None}
+
+
+def get_station_index():
+    """
+    Returns the spatial station index: the mapped snapshot if one is deployed,
+    otherwise an in-memory snapshot built from the database and rebuilt whenever
+    the station data version changes.
+    """
+    snapshot = get_station_snapshot()
+    if snapshot is not None:
+        return snapshot
+
+    version, _ = get_station_data_version()
+    if _db_index["version"] != version:
+        stations = FuelStation.objects.filter(lat__isnull=False, lon__isnull=False) \
+            .values_list("id", "lat", "lon", "price").iterator()
+        _db_index["snapshot"] = StationSnapshot(build_snapshot(stations))
+        _db_index["version"] = version
+    return _db_index["snapshot"]
+
+
+def refresh_station_snapshot(path=None):
+    """
+    Rewrites the snapshot from the database if one is already deployed.
+    Called by the importers so workers pick up new prices without a restart.
+    The grid cell size of the deployed file (e.g. from `--cell-size`) is kept.
+    """
+    path = path or settings.STATION_SNAPSHOT_PATH
+    if not os.path.exists(path):
+        return None
+    try:
+        cell_degrees = StationSnapshot.open(path).cell_degrees
+    except (OSError, ValueError, SnapshotError):
+        cell_degrees = GRID_CELL_DEGREES  # Unreadable file: rebuild it with the default grid
+    stations = FuelStation.objects.filter(lat__isnull=False, lon__isnull=False) \
+        .values_list("id", "lat", "lon", "price").iterator()
+    return write_snapshot(path, stations, cell_degrees)
@@ -0,0 +1,55 @@
+from math import radians, sin, cos, sqrt, atan2, floor
+
+# Size of one spatial grid cell in degrees (lat and lon).
+# 0.5° is roughly 35 miles north-south, small enough to prune most of the US
+# but big enough that a 5-mile route corridor only touches a handful of cells.
+GRID_CELL_DEGREES = 0.5
+
+# Miles per degree of latitude (constant) – used to size grid searches.
+MILES_PER_DEGREE_LAT = 69.0
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Haversine formula to calculate the great-circle distance between two points on Earth.
+    Formula:
+      a = sin²(Δφ/2) + cos(φ1) ⋅ cos(φ2) ⋅ sin²(Δλ/2)
+      c = 2 ⋅ atan2(√a, √(1−a))
+      d = R ⋅ c
+    Where:
+      - φ1, λ1: Latitude and Longitude of first point (in radians)
+      - φ2, λ2: Latitude and Longitude of second point (in radians)
+      - R = 3959 miles (Earth’s radius)
+    """
+    try:
+        R = 3959  # Earth's radius in miles
+        lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+        dlat = lat2 - lat1
+        dlon = lon2 - lon1
+        a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
+        c = 2 * atan2(sqrt(a), sqrt(1 - a))
+        return R * c  # Distance in miles
+    except Exception as e:
+        print(f"Error in haversine calculation: {e}")
+        return None
+
+
+def grid_cell(lat, lon, cell_degrees=GRID_CELL_DEGREES):
+    """
+    Returns the (row, col) grid cell that contains the given coordinate.
+    Rows and columns are counted from (0°, 0°), so they can be negative.
+    """
+    return int(floor(lat / cell_degrees)), int(floor(lon / cell_degrees))
+
+
+def cells_within(lat, lon, radius_miles, cell_degrees=GRID_CELL_DEGREES):
+    """
+    Returns the (row_min, row_max, col_min, col_max) block of grid cells that
+    fully covers a circle of `radius_miles` around the given coordinate.
+    """
+    dlat = radius_miles / MILES_PER_DEGREE_LAT
+    # Longitude degrees shrink with latitude; clamp to avoid blowing up near the poles
+    dlon = radius_miles / (MILES_PER_DEGREE_LAT * max(cos(radians(lat)), 0.01))
+    row_min, col_min = grid_cell(lat - dlat, lon - dlon, cell_degrees)
+    row_max, col_max = grid_cell(lat + dlat, lon + dlon, cell_degrees)
+    return row_min, row_max, col_min, col_max
@@ -1,3 +1,540 @@
-from django.test import TestCase
+import csv
+import importlib
+import io
+import json
+import os
+import tempfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import polyline
+import requests
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from .csv_import import FuelPriceReader, StationDedupIndex, reprice_stations
+from .aggregates import DEFAULT_FUEL_PRICE, get_fallback_fuel_price, price_stats, refresh_price_aggregates
+from .api.views import get_optimal_fuel_stations, route_cache_key
+from .data_version import get_station_data_version
+from .models import FuelStation, GridCellPriceAggregate, StatePriceAggregate
+from .road_graph import METERS_PER_MILE, RoadGraph, route_on_graph
+from .routing import LocalGraphBackend, ORSBackend, RoutingBackend, RoutingError, get_routing_backend
+from .snapshot import (
+    HEADER, SnapshotError, StationSnapshot, build_snapshot, get_station_snapshot, refresh_station_snapshot,
+    write_snapshot,
+)
+from .spatial import grid_cell, haversine
+
+# Tests must not clear the developer's on-disk response cache
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+# Route used by the calculate_route tests: 800 points about one mile apart, heading east along 35°N
+ROUTE_POINTS = [(35.0, -105.0 + i / 56.6) for i in range(800)]
+ROUTE_DATA = {
+    "routes": [{
+        "geometry": polyline.encode(ROUTE_POINTS),
+        "summary": {"distance": 800 * 1609.34},
+        "segments": [{"distance": 800 * 1609.34}],
+    }]
+}
+
+
+def create_station(name, price, lat=None, lon=None, state="NM"):
+    return FuelStation.objects.create(name=name, address="I-40", city="Somewhere", state=state,
+                                      price=price, lat=lat, lon=lon)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StationSnapshotTests(SimpleTestCase):
+    stations = [
+        (1, 35.0, -100.0, 3.1),
+        (2, 35.1, -100.2, 2.9),
+        (3, 40.0, -90.0, 3.5),
+        (4, None, None, 3.0),  # Not geocoded: skipped
+    ]
+
+    def test_round_trip(self):
+        snapshot = StationSnapshot(build_snapshot(self.stations))
+        self.assertEqual(len(snapshot), 3)
+        self.assertEqual(sorted(snapshot.ids), [1, 2, 3])
+        station = snapshot.station(list(snapshot.ids).index(2))
+        self.assertEqual(station["price"], Decimal("2.900"))
+        self.assertEqual((station["lat"], station["lon"]), (35.1, -100.2))
+
+    def test_indices_near_matches_brute_force(self):
+        snapshot = StationSnapshot(build_snapshot(self.stations))
+        near = {snapshot.ids[i] for i, _ in snapshot.indices_near(35.0, -100.0, 20)}
+        self.assertEqual(near, {1, 2})
+        brute = {
+            snapshot.ids[i] for i in range(len(snapshot))
+            if haversine(35.0, -100.0, snapshot.lats[i], snapshot.lons[i]) <= 20
+        }
+        self.assertEqual(near, brute)
+
+    def test_empty_snapshot(self):
+        snapshot = StationSnapshot(build_snapshot([]))
+        self.assertEqual(len(snapshot), 0)
+        self.assertEqual(list(snapshot.indices_near(35.0, -100.0, 100)), [])
+
+    def test_truncated_snapshot_is_rejected(self):
+        data = build_snapshot(self.stations)
+        with self.assertRaises(SnapshotError):
+            StationSnapshot(data[:-8])
+        with self.assertRaises(SnapshotError):
+            StationSnapshot(data[:HEADER.size - 1])
+
+    def test_unknown_version_or_magic_is_rejected(self):
+        data = bytearray(build_snapshot(self.stations))
+        data[8:12] = (99).to_bytes(4, "little")
+        with self.assertRaises(SnapshotError):
+            StationSnapshot(bytes(data))
+        with self.assertRaises(SnapshotError):
+            StationSnapshot(b"NOTSNAPS" + bytes(data[8:]))
+
+    def test_reader_remaps_after_swap(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "stations.bin")
+            self.assertIsNone(get_station_snapshot(path))
+
+            self.assertEqual(write_snapshot(path, self.stations[:1]), 1)
+            self.assertEqual(len(get_station_snapshot(path)), 1)
+
+            write_snapshot(path, self.stations)
+            self.assertEqual(len(get_station_snapshot(path)), 3)
+            self.assertFalse(os.path.exists(f"{path}.tmp"))
+
+    def test_swap_changes_the_data_version(self):
+        with tempfile.TemporaryDirectory() as directory:
+            before = get_station_data_version()
+            write_snapshot(os.path.join(directory, "stations.bin"), self.stations)
+            self.assertNotEqual(before, get_station_data_version())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CalculateRouteSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Near the route at about mile 300, and far away from it
+        create_station("On route", "3.100", 35.01, -105.0 + 300 / 56.6)
+        create_station("Off route", "2.500", 45.0, -90.0)
+
+    def post_route(self):
+        backend = mock.Mock()
+        backend.route.return_value = ROUTE_DATA
+        with mock.patch("fuel_route.api.views.get_routing_backend", return_value=backend), \
+                mock.patch("builtins.print"):
+            response = self.client.post(
+                "/fuel/api/calculate-route/",
+                json.dumps({"start_lat": 35.0, "start_lon": -105.0, "end_lat": 35.0, "end_lon": -90.9}),
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        return [feature["properties"] for feature in response.json()["features"][1:]]
+
+    def test_snapshot_and_database_paths_agree(self):
+        from_database = self.post_route()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "stations.bin")
+            write_snapshot(path, FuelStation.objects.values_list("id", "lat", "lon", "price"))
+            cache.clear()
+            with override_settings(STATION_SNAPSHOT_PATH=path):
+                from_snapshot = self.post_route()
+
+        self.assertEqual(from_database, from_snapshot)
+        self.assertEqual([stop["name"] for stop in from_snapshot], ["On route"])
+        self.assertEqual(from_snapshot[0]["price"], "3.100")
+
+    def test_refresh_keeps_the_deployed_cell_size(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "stations.bin")
+            write_snapshot(path, [], cell_degrees=0.25)
+            self.assertEqual(refresh_station_snapshot(path), 2)
+            self.assertEqual(StationSnapshot.open(path).cell_degrees, 0.25)
+
+
+class PriceStatsTests(SimpleTestCase):
+    def test_percentiles(self):
+        stats = price_stats([Decimal(p) / 10 for p in range(30, 50)])  # 3.0 .. 4.9
+        self.assertEqual(stats["station_count"], 20)
+        self.assertEqual(stats["min_price"], Decimal("3.0"))
+        self.assertEqual(stats["p10_price"], Decimal("3.1"))  # nearest rank: 2nd of 20
+        self.assertEqual(stats["median_price"], Decimal("3.950"))
+
+    def test_single_price(self):
+        stats = price_stats(["3.250"])
+        self.assertEqual((stats["min_price"], stats["p10_price"], stats["median_price"]),
+                         (Decimal("3.250"), Decimal("3.250"), Decimal("3.250")))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PriceAggregateRefreshTests(TestCase):
+    def test_incremental_refresh_only_touches_given_keys(self):
+        texas = create_station("TX 1", "3.000", 31.0, -97.0, state="TX")
+        create_station("OK 1", "3.500", 35.5, -97.5, state="OK")
+        refresh_price_aggregates()
+        self.assertEqual(StatePriceAggregate.objects.count(), 2)
+        self.assertEqual(GridCellPriceAggregate.objects.count(), 2)
+
+        FuelStation.objects.filter(state="OK").update(price="2.000")
+        texas.price = "2.500"
+        texas.save()
+        refresh_price_aggregates(states={"TX"}, cells={grid_cell(31.0, -97.0)})
+
+        self.assertEqual(StatePriceAggregate.objects.get(state="TX").min_price, Decimal("2.500"))
+        # OK wasn't refreshed, so it still has the old price
+        self.assertEqual(StatePriceAggregate.objects.get(state="OK").min_price, Decimal("3.500"))
+
+    def test_stale_aggregates_are_deleted(self):
+        station = create_station("TX 1", "3.000", 31.0, -97.0, state="TX")
+        refresh_price_aggregates()
+        station.delete()
+        refresh_price_aggregates(states={"TX"}, cells={grid_cell(31.0, -97.0)})
+        self.assertFalse(StatePriceAggregate.objects.exists())
+        self.assertFalse(GridCellPriceAggregate.objects.exists())
+
+    def test_refresh_more_than_a_thousand_cells(self):
+        FuelStation.objects.bulk_create([
+            FuelStation(name=f"Stop {i}", address="I-40", city="Somewhere", state="NM", price="3.000",
+                        lat=30.25 + i // 40, lon=-119.75 + i % 40)
+            for i in range(1200)
+        ])
+        cells = {grid_cell(lat, lon) for lat, lon in FuelStation.objects.values_list("lat", "lon")}
+        self.assertEqual(len(cells), 1200)
+
+        refresh_price_aggregates(states=set(), cells=cells)
+        self.assertEqual(GridCellPriceAggregate.objects.count(), 1200)
+
+        FuelStation.objects.all().delete()
+        refresh_price_aggregates(states=set(), cells=cells)
+        self.assertFalse(GridCellPriceAggregate.objects.exists())
+
+    def test_fallback_price(self):
+        self.assertEqual(get_fallback_fuel_price(), DEFAULT_FUEL_PRICE)
+        create_station("TX 1", "3.000", state="TX")
+        create_station("TX 2", "3.000", state="TX")
+        create_station("OK 1", "4.000", state="OK")
+        refresh_price_aggregates()
+        self.assertAlmostEqual(get_fallback_fuel_price(), (2 * 3.0 + 4.0) / 3)
+
+    def test_endpoint_filters_cells_by_state(self):
+        cache.clear()
+        create_station("TX 1", "3.000", 31.0, -97.0, state="TX")
+        create_station("OK 1", "3.500", 35.5, -97.5, state="OK")
+        refresh_price_aggregates()
+
+        lower = self.client.get("/fuel/api/price-aggregates/?state=tx").json()
+        upper = self.client.get("/fuel/api/price-aggregates/?state=TX").json()
+        self.assertEqual(lower, upper)
+        self.assertEqual([state["state"] for state in upper["states"]], ["TX"])
+        self.assertEqual([(cell["row"], cell["col"]) for cell in upper["cells"]], [grid_cell(31.0, -97.0)])
+
+        everything = self.client.get("/fuel/api/price-aggregates/").json()
+        self.assertEqual(len(everything["states"]), 2)
+        self.assertEqual(len(everything["cells"]), 2)
+
+
+class OptimalStationPruningTests(SimpleTestCase):
+    def test_cheapest_station_wins_across_cells(self):
+        # Two stations near the route in different grid cells
+        stations = [
+            {"id": 1, "name": "Expensive", "lat": 35.01, "lon": -105.0 + 100 / 56.6, "price": Decimal("3.000")},
+            {"id": 2, "name": "Cheap", "lat": 35.01, "lon": -105.0 + 200 / 56.6, "price": Decimal("2.000")},
+        ]
+        self.assertNotEqual(grid_cell(stations[0]["lat"], stations[0]["lon"]),
+                            grid_cell(stations[1]["lat"], stations[1]["lon"]))
+        with mock.patch("builtins.print"):
+            stops = get_optimal_fuel_stations(ROUTE_DATA, stations)
+        self.assertEqual([stop["name"] for stop in stops], ["Cheap"])
+
+
+class RoadGraphTests(SimpleTestCase):
+    # A square with a long diagonal shortcut that is actually slower (explicit distance),
+    # plus an island node that isn't connected to anything.
+    nodes = [[35.0, -100.0], [35.0, -99.0], [36.0, -99.0], [36.0, -100.0], [40.0, -80.0]]
+    edges = [[0, 1], [1, 2], [2, 3], [3, 0], [0, 2, 10_000_000]]
+
+    def setUp(self):
+        self.graph = RoadGraph(self.nodes, self.edges)
+
+    def test_shortest_path_avoids_the_slow_shortcut(self):
+        path, distance = self.graph.shortest_path(0, 2)
+        self.assertIn(path, ([0, 1, 2], [0, 3, 2]))
+        expected = min(
+            haversine(35.0, -100.0, 35.0, -99.0) + haversine(35.0, -99.0, 36.0, -99.0),
+            haversine(35.0, -100.0, 36.0, -100.0) + haversine(36.0, -100.0, 36.0, -99.0),
+        ) * METERS_PER_MILE
+        self.assertAlmostEqual(distance, expected, places=3)
+
+    def test_disconnected_nodes(self):
+        self.assertEqual(self.graph.shortest_path(0, 4), (None, None))
+
+    def test_snapping(self):
+        self.assertEqual(self.graph.nearest_node(35.01, -99.01)[0], 1)
+        self.assertEqual(self.graph.nearest_node(0.0, 0.0), (None, None))
+
+    def test_route_has_the_ors_shape(self):
+        route = route_on_graph(self.graph, 35.0, -100.0, 36.0, -99.0)["routes"][0]
+        points = polyline.decode(route["geometry"])
+        self.assertEqual(points[0], (35.0, -100.0))
+        self.assertEqual(points[-1], (36.0, -99.0))
+        self.assertGreater(len(points), 100)  # Densified to about one point per mile
+        self.assertEqual(route["summary"]["distance"], route["segments"][0]["distance"])
+
+
+class RoutingBackendTests(SimpleTestCase):
+    def test_base_class_is_abstract(self):
+        with self.assertRaises(TypeError):
+            RoutingBackend()
+
+    def test_unknown_backend(self):
+        with self.assertRaises(RoutingError):
+            get_routing_backend("carrier-pigeon")
+
+    def test_ors_network_errors_become_routing_errors(self):
+        with mock.patch("fuel_route.routing.requests.post", side_effect=requests.Timeout("slow")) as post:
+            with self.assertRaises(RoutingError):
+                ORSBackend().route(35.0, -100.0, 36.0, -99.0)
+        self.assertIsNotNone(post.call_args.kwargs["timeout"])
+
+        with mock.patch("fuel_route.routing.requests.post", return_value=mock.Mock(status_code=403)):
+            with self.assertRaises(RoutingError):
+                ORSBackend().route(35.0, -100.0, 36.0, -99.0)
+
+    def write_graph(self, directory, nodes):
+        path = os.path.join(directory, "graph.json")
+        with open(path, "w") as file:
+            json.dump({"nodes": nodes, "edges": [[0, 1]]}, file)
+        return path
+
+    def test_local_backend_rejects_invalid_coordinates(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = self.write_graph(directory, [[35.0, -100.0], [35.0, -99.0]])
+            with override_settings(ROAD_GRAPH_PATH=path):
+                for start_lat, start_lon in ((float("nan"), -100.0), (35.0, float("inf")), (91.0, -100.0)):
+                    with self.subTest(start=(start_lat, start_lon)), self.assertRaises(RoutingError):
+                        LocalGraphBackend().route(start_lat, start_lon, 35.0, -99.0)
+
+    def test_route_cache_key_tracks_the_local_graph_file(self):
+        request = RequestFactory().post(
+            "/fuel/api/calculate-route/",
+            json.dumps({"start_lat": 35.0, "start_lon": -100.0, "end_lat": 35.0, "end_lon": -99.0}),
+            content_type="application/json",
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            path = self.write_graph(directory, [[35.0, -100.0], [35.0, -99.0]])
+            with override_settings(ROUTING_BACKEND="local", ROAD_GRAPH_PATH=path):
+                before = route_cache_key(request)
+                os.remove(path)
+                self.write_graph(directory, [[35.0, -100.0], [35.0, -99.0], [36.0, -99.0]])
+                self.assertNotEqual(before, route_cache_key(request))
+
+    def test_malformed_graph_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "graph.json")
+            with open(path, "w") as file:
+                json.dump({"nodes": [[35.0, -100.0], [35.0, -99.0]], "edges": [[0, None]]}, file)
+            with override_settings(ROAD_GRAPH_PATH=path):
+                with self.assertRaises(RoutingError):
+                    LocalGraphBackend().route(35.0, -100.0, 35.0, -99.0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.station = create_station("Station", "3.100", 35.0, -100.0)
+
+    def test_conditional_get(self):
+        response = self.client.get("/fuel/fuel-stations/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Last-Modified", response)
+
+        not_modified = self.client.get("/fuel/fuel-stations/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_cache_hit_runs_no_queries_and_ignores_unused_params(self):
+        first = self.client.get("/fuel/fuel-stations/?_=1")
+        with self.assertNumQueries(0):
+            second = self.client.get("/fuel/fuel-stations/?_=2")
+        self.assertEqual(first["ETag"], second["ETag"])
+        self.assertEqual(first.content, second.content)
+
+    def test_queryset_update_invalidates(self):
+        response = self.client.get("/fuel/fuel-stations/")
+        with self.captureOnCommitCallbacks(execute=True):
+            FuelStation.objects.filter(pk=self.station.pk).update(price="1.000")
+
+        fresh = self.client.get("/fuel/fuel-stations/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(fresh.json()[0]["price"], "1.000")
+
+    def test_save_and_delete_invalidate(self):
+        before = get_station_data_version()
+        self.station.price = "2.000"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.station.save()
+        after_save = get_station_data_version()
+        self.assertNotEqual(before, after_save)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.station.delete()
+        self.assertNotEqual(after_save, get_station_data_version())
+        self.assertEqual(self.client.get("/fuel/fuel-stations/").json(), [])
+
+    def test_errors_are_not_cached(self):
+        backend = mock.Mock()
+        backend.route.side_effect = RoutingError("down")
+        body = json.dumps({"start_lat": 35.0, "start_lon": -105.0, "end_lat": 35.0, "end_lon": -90.9})
+        with mock.patch("fuel_route.api.views.get_routing_backend", return_value=backend):
+            for _ in range(2):
+                response = self.client.post("/fuel/api/calculate-route/", body, content_type="application/json")
+                self.assertEqual(response.status_code, 500)
+        self.assertEqual(backend.route.call_count, 2)
+
+
+CSV_HEADER = ["OPIS Truckstop ID", "Truckstop Name", "Address", "City", "State", "Rack ID", "Retail Price"]
+
+
+def write_price_csv(directory, rows):
+    path = os.path.join(directory, "prices.csv")
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(CSV_HEADER)
+        writer.writerows(rows)
+    return path
+
+
+@override_settings(CACHES=LOCMEM_CACHES, STATION_SNAPSHOT_PATH="/nonexistent/station_snapshot.bin")
+class CsvImportTests(TestCase):
+    rows = [
+        ["1", "Stop A", "I-40 Exit 1", "Gallup", "nm", "10", "3.200"],
+        ["2", "Stop B", "I-40 Exit 2", "Grants", "NM", "10", "3.400"],
+        ["1", "Stop A", "I-40 Exit 1", "Gallup", "NM", "11", "3.150"],
+        ["3", "Stop C", "I-40 Exit 3", "Amarillo", "TX", "10", "abc"],
+        ["4", "", "I-40 Exit 4", "Amarillo", "TX", "10", "3.000"],
+        ["5", "Stop E", "I-40 Exit 5", "Amarillo", "Texas", "10", "3.000"],
+        ["6", "Stop F", "I-40 Exit 6", "Amarillo", "TX", "10"],
+        ["2", "Stop B", "I-40 Exit 2", "Grants", "NM", "11", "3.100"],
+        ["7", "Stop G", "I-40 Exit 7", "Tucumcari", "NM", "10", "3.300"],
+        ["2", "Stop B", "I-40 Exit 2", "Grants", "NM", "12", "3.500"],
+    ]
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = write_price_csv(self.directory.name, self.rows)
+
+    def test_reader_rejects_invalid_rows(self):
+        reader = FuelPriceReader(self.path, chunk_size=3)
+        chunks = list(reader)
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 3])
+        self.assertEqual(reader.total_rows, 10)
+        self.assertEqual([rejected.line for rejected in reader.rejected], [5, 6, 7, 8])
+        self.assertEqual(chunks[0].states[0], "NM")
+
+    def test_dedup_index_keeps_the_cheapest_row_across_chunks(self):
+        dedup = StationDedupIndex()
+        new, cheaper = [], []
+        for chunk in FuelPriceReader(self.path, chunk_size=2):
+            chunk_new, chunk_cheaper = dedup.split(chunk)
+            new.extend(chunk_new.opis_ids)
+            cheaper.extend((row.opis_id, row.price, stored.price) for row, stored in chunk_cheaper)
+
+        self.assertEqual(new, [1, 2, 7])
+        self.assertEqual(cheaper, [(1, 3.15, 3.2), (2, 3.1, 3.4)])
+        self.assertEqual(dedup.merged, 3)
+
+    def test_import_commits_each_chunk(self):
+        with mock.patch("fuel_route.management.commands.import_fuel_data.CSV_PATH", self.path):
+            call_command("import_fuel_data", chunk_size=2, stdout=io.StringIO())
+
+        prices = dict(FuelStation.objects.values_list("name", "price"))
+        self.assertEqual(prices, {"Stop A": Decimal("3.150"), "Stop B": Decimal("3.100"), "Stop G": Decimal("3.300")})
+        self.assertEqual(StatePriceAggregate.objects.get(state="NM").station_count, 3)
+
+    def test_reprice_matches_rows_by_opis_id(self):
+        # Same name and address listed under two OPIS ids, like "Fast Stop" in Sorrento, LA
+        for opis_id in (8, 9):
+            FuelStation.objects.create(name="Fast Stop", address="I-10 Exit 182", city="Sorrento", state="LA",
+                                       price="3.500", opis_id=opis_id)
+        path = write_price_csv(self.directory.name, [
+            ["8", "Fast Stop", "I-10 Exit 182", "Sorrento", "LA", "10", "3.500"],
+            ["9", "Fast Stop", "I-10 Exit 182", "Sorrento", "LA", "10", "3.500"],
+            ["8", "Fast Stop", "I-10 Exit 182", "Sorrento", "LA", "11", "3.000"],
+        ])
+        dedup = StationDedupIndex()
+        first, second = FuelPriceReader(path, chunk_size=2)
+        dedup.split(first)
+        _, cheaper = dedup.split(second)
+
+        with self.assertNumQueries(2):  # One lookup, one bulk UPDATE
+            self.assertEqual(reprice_stations(cheaper), 1)
+        prices = dict(FuelStation.objects.values_list("opis_id", "price"))
+        self.assertEqual(prices, {8: Decimal("3.000"), 9: Decimal("3.500")})
+
+    @mock.patch("time.sleep")
+    @mock.patch("builtins.print")
+    def test_update_keeps_chunks_written_before_a_failure(self, _print, _sleep):
+        command = importlib.import_module("fuel_route.management.commands.update-fuel-stations")
+        located = {"I-40 Exit 1": (35.5, -108.7), "I-40 Exit 2": (35.2, -107.9)}
+
+        def geocode(address, city, state):
+            if address not in located:
+                raise RuntimeError("geocoder down")
+            return located[address]
+
+        with mock.patch.object(command, "CSV_PATH", self.path), \
+                mock.patch.object(command, "get_lat_lon_from_address", geocode):
+            with self.assertRaises(RuntimeError):
+                call_command("update-fuel-stations", chunk_size=2, stdout=io.StringIO())
+
+        # Stop G (third chunk) failed, the first two chunks were already saved with the cheapest prices
+        prices = dict(FuelStation.objects.values_list("name", "price"))
+        self.assertEqual(prices, {"Stop A": Decimal("3.150"), "Stop B": Decimal("3.100")})
+
+
+@override_settings(CACHES=LOCMEM_CACHES, STATION_SNAPSHOT_PATH="/nonexistent/station_snapshot.bin")
+class ReachableStationsTests(TestCase):
+    url = "/fuel/api/reachable-stations/"
+
+    def setUp(self):
+        create_station("Near", "3.300", 35.0, -100.0)
+        create_station("Cheap", "2.900", 35.0, -100.5)
+        create_station("Far", "2.500", 35.0, -95.0)
+        cache.clear()
+
+    def test_ranking_and_filters(self):
+        data = self.client.get(self.url, {"lat": 35.0, "lon": -100.0, "gallons": 6, "mode": "radius"}).json()
+        self.assertEqual(data["reachable_count"], 2)
+        self.assertEqual([station["name"] for station in data["stations"]], ["Cheap", "Near"])
+        self.assertEqual(data["cheapest"]["price"], "2.900")
+
+        nearest = self.client.get(self.url, {"lat": 35.0, "lon": -100.0, "gallons": 6, "mode": "radius", "k": 1})
+        self.assertEqual([station["name"] for station in nearest.json()["stations"]], ["Near"])
+
+        capped = self.client.get(self.url, {"lat": 35.0, "lon": -100.0, "gallons": 6, "max_price": 3.0})
+        self.assertEqual([station["name"] for station in capped.json()["stations"]], ["Cheap"])
+
+    def test_cheapest_reuses_the_ranked_stations(self):
+        params = {"lat": 35.0, "lon": -100.0, "gallons": 6}
+        self.client.get(self.url, params)  # Builds the station index
+        with self.assertNumQueries(1):  # A single in_bulk for the returned stations
+            data = self.client.get(self.url, params).json()
+        self.assertEqual(data["cheapest"], data["stations"][0])
+
+    def test_limit_zero_still_reports_cheapest(self):
+        data = self.client.get(self.url, {"lat": 35.0, "lon": -100.0, "gallons": 6, "limit": 0}).json()
+        self.assertEqual(data["stations"], [])
+        self.assertEqual(data["cheapest"]["name"], "Cheap")
+
+    def test_invalid_numbers_are_rejected(self):
+        base = {"lat": 35.0, "lon": -100.0, "gallons": 6}
+        for params in (
+            {"lat": "nan"}, {"lon": "inf"}, {"gallons": "1e400"}, {"mpg": "-inf"}, {"max_price": "nan"},
+            {"lat": 91}, {"lon": -180.5}, {"k": -1}, {"limit": -1}, {"gallons": 1e300, "mpg": 1e300},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, {**base, **params})
+                self.assertEqual(response.status_code, 400)
@@ -1,9 +1,11 @@
 from django.http import JsonResponse
 from .models import FuelStation
+from .response_cache import cached_response, no_params_key
 from django.shortcuts import render
 from django.conf import settings
 
 
+@cached_response(no_params_key)
 def list_fuel_stations(request):
     fuel_stations = FuelStation.objects.all().values("id","address", "city" ,"name", "price", "state", "lat", "lon",)
     return JsonResponse(list(fuel_stations), safe=False)
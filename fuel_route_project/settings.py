@@ -137,4 +137,28 @@ load_dotenv()
 # ORS API key'ini almak
 ORS_API_KEY = os.getenv('ORS_API_KEY')
 
+# Seconds to wait for OpenRouteService before giving up
+ORS_TIMEOUT = float(os.getenv('ORS_TIMEOUT', 10))
+
 MAPBOX_API_KEY = os.getenv('MAPBOX_API_KEY')
+
+# Memory-mapped station snapshot (see `manage.py snapshot_fuel_stations`)
+STATION_SNAPSHOT_PATH = os.getenv('STATION_SNAPSHOT_PATH', os.path.join(BASE_DIR, 'station_snapshot.bin'))
+
+# Routing backend used by calculate_route: "ors" (OpenRouteService) or "local" (road graph file)
+ROUTING_BACKEND = os.getenv('ROUTING_BACKEND', 'ors')
+
+ROAD_GRAPH_PATH = os.getenv('ROAD_GRAPH_PATH', os.path.join(BASE_DIR, 'road_graph.json'))
+
+# Response cache for the station and route endpoints (any Django cache backend).
+# It also holds the station-data version token, so it must be shared by all worker processes.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+    }
+}
+
+FUEL_ROUTE_CACHE_ALIAS = os.getenv('FUEL_ROUTE_CACHE_ALIAS', 'default')
+
+FUEL_ROUTE_CACHE_TIMEOUT = int(os.getenv('FUEL_ROUTE_CACHE_TIMEOUT', 60 * 60))